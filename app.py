@@ -1,8 +1,16 @@
+# Patch the stdlib for cooperative I/O before anything else is imported,
+# so file and socket operations yield to other green threads under the
+# gevent worker.
+from gevent import monkey
+monkey.patch_all()
+
 import os
 import json
-from flask import Flask, request, jsonify, send_from_directory
+import time
+import orjson
+from flask import Flask, request, jsonify
 from flask_cors import CORS
-from tracker import tracker_bp
+from tracker import tracker_bp, VisitorService
 
 
 def load_config(config_path='config.json'):
@@ -22,8 +30,9 @@ def create_app(config=None):
     app.config['SECRET_KEY'] = app_config.get('secret_key', 'dev-secret-key')
     app.config['TRACKER_CONFIG'] = config
 
-    app.config['JSON_AS_ASCII'] = False
-    app.config['JSON_SORT_KEYS'] = False
+    # Tracking payloads are tiny; let Werkzeug reject oversized bodies
+    # with a 413 before any JSON parsing happens.
+    app.config['MAX_CONTENT_LENGTH'] = 64 * 1024
 
     domains_config = config.get('domains', {})
     cors_origins = domains_config.get('cors_origins', ['*'])
@@ -34,37 +43,73 @@ def create_app(config=None):
          allow_headers=['Content-Type', 'Authorization', 'X-Requested-With'],
          supports_credentials=False)
 
+    app.extensions['visitor_service'] = VisitorService(config.get('tracking', {}))
+
     app.register_blueprint(tracker_bp, url_prefix='/api/tracker')
 
     os.makedirs('static', exist_ok=True)
     os.makedirs('data', exist_ok=True)
 
+    # The index payload never changes, so serialize it once at startup.
+    index_body = orjson.dumps({
+        'service': 'Visitor Tracker API',
+        'version': '1.0.0',
+        'status': 'running',
+        'endpoints': {
+            'tracker_js': '/tracker.js',
+            'track_visit': 'POST /api/tracker/visit',
+            'track_event': 'POST /api/tracker/event',
+            'stats': 'GET /api/tracker/stats',
+            'logs': 'GET /api/tracker/logs',
+            'health': 'GET /api/tracker/health'
+        }
+    })
+
     @app.route('/')
     def index():
-        return jsonify({
-            'service': 'Visitor Tracker API',
-            'version': '1.0.0',
-            'status': 'running',
-            'endpoints': {
-                'tracker_js': '/tracker.js',
-                'track_visit': 'POST /api/tracker/visit',
-                'track_event': 'POST /api/tracker/event',
-                'stats': 'GET /api/tracker/stats',
-                'logs': 'GET /api/tracker/logs',
-                'health': 'GET /api/tracker/health'
-            }
-        })
+        return app.response_class(index_body, mimetype='application/json')
+
+    tracker_js_path = os.path.join(os.getcwd(), 'static', 'tracker.js')
+    tracker_js_cache = {'body': None, 'etag': '', 'mtime': 0.0, 'checked_at': 0.0}
+
+    def load_tracker_js():
+        # Serve from memory and only re-stat the file once a minute, so
+        # the hot path costs no syscalls while edits still show up.
+        now = time.time()
+        if now - tracker_js_cache['checked_at'] < 60:
+            return tracker_js_cache
+        tracker_js_cache['checked_at'] = now
+
+        try:
+            mtime = os.stat(tracker_js_path).st_mtime
+        except OSError:
+            tracker_js_cache['body'] = None
+            return tracker_js_cache
+
+        if tracker_js_cache['body'] is None or mtime != tracker_js_cache['mtime']:
+            with open(tracker_js_path, 'rb') as f:
+                tracker_js_cache['body'] = f.read()
+            tracker_js_cache['mtime'] = mtime
+            tracker_js_cache['etag'] = f'"{int(mtime)}-{len(tracker_js_cache["body"])}"'
+
+        return tracker_js_cache
 
     @app.route('/tracker.js')
     def serve_tracker_js():
-        static_dir = os.path.join(os.getcwd(), 'static')
-        if os.path.exists(os.path.join(static_dir, 'tracker.js')):
-            response = send_from_directory(static_dir, 'tracker.js', mimetype='application/javascript')
-            response.headers['Cache-Control'] = 'public, max-age=3600'
-            return response
-        else:
+        cache = load_tracker_js()
+        if cache['body'] is None:
             return jsonify({'error': 'tracker.js not found'}), 404
 
+        headers = {
+            'Cache-Control': 'public, max-age=86400',
+            'ETag': cache['etag']
+        }
+
+        if request.headers.get('If-None-Match') == cache['etag']:
+            return '', 304, headers
+
+        return app.response_class(cache['body'], mimetype='application/javascript', headers=headers)
+
     @app.route('/favicon.ico')
     def favicon():
         return '', 204
@@ -74,9 +119,8 @@ def create_app(config=None):
         if config.get('logging', {}).get('enable_http_logging', True):
             if request.path.startswith('/api/tracker'):
                 try:
-                    from tracker.services import VisitorService
-                    service = VisitorService(config.get('tracking', {}))
-                    service.log_http_request({
+                    service = app.extensions['visitor_service']
+                    service.log_http_request_async({
                         'method': request.method,
                         'path': request.path,
                         'ip': request.remote_addr,
@@ -88,26 +132,39 @@ def create_app(config=None):
 
         return response
 
+    internal_error_body = orjson.dumps({
+        'error': 'Internal server error',
+        'message': 'An unexpected error occurred'
+    })
+
+    payload_too_large_body = orjson.dumps({
+        'error': 'Payload too large',
+        'message': 'Request body exceeds the allowed size'
+    })
+
     @app.errorhandler(404)
     def not_found(error):
-        return jsonify({
+        body = orjson.dumps({
             'error': 'Not found',
             'message': f'Endpoint {request.path} not found'
-        }), 404
+        })
+        return app.response_class(body, status=404, mimetype='application/json')
 
     @app.errorhandler(500)
     def internal_error(error):
-        return jsonify({
-            'error': 'Internal server error',
-            'message': 'An unexpected error occurred'
-        }), 500
+        return app.response_class(internal_error_body, status=500, mimetype='application/json')
+
+    @app.errorhandler(413)
+    def payload_too_large(error):
+        return app.response_class(payload_too_large_body, status=413, mimetype='application/json')
 
     @app.errorhandler(405)
     def method_not_allowed(error):
-        return jsonify({
+        body = orjson.dumps({
             'error': 'Method not allowed',
             'message': f'Method {request.method} not allowed for this endpoint'
-        }), 405
+        })
+        return app.response_class(body, status=405, mimetype='application/json')
 
     return app
 
@@ -1,30 +1,38 @@
-from flask import Blueprint, request, jsonify, Response
-from tracker.services import VisitorService
-from tracker.utils import validate_visitor_data, rate_limit_check
+import orjson
+from flask import Blueprint, current_app, request, Response
+from tracker.utils import validate_visitor_data, rate_limit_check, extract_fields
 
 tracker_bp = Blueprint('tracker', __name__)
 
-
-def get_config():
-    from flask import current_app
-    return current_app.config.get('TRACKER_CONFIG', {})
+_HEALTH_BODY = orjson.dumps({
+    'status': 'healthy',
+    'service': 'visitor-tracker',
+    'version': '1.0.0'
+})
 
 
 def get_visitor_service():
-    config = get_config()
-    return VisitorService(config.get('tracking', {}))
+    return current_app.extensions['visitor_service']
+
+
+def json_response(payload, status=200):
+    return current_app.response_class(
+        orjson.dumps(payload),
+        status=status,
+        mimetype='application/json'
+    )
 
 
 @tracker_bp.route('/visit', methods=['POST'])
 def track_visit():
     if not rate_limit_check(request.remote_addr):
-        return jsonify({'error': 'Rate limit exceeded', 'message': '请求过于频繁'}), 429
+        return json_response({'error': 'Rate limit exceeded', 'message': '请求过于频繁'}, 429)
 
-    data = request.get_json()
+    data = extract_fields(request.stream, ('pageUrl', 'referrer', 'screenResolution', 'language', 'timestamp'))
     validation = validate_visitor_data(data)
 
     if not validation['valid']:
-        return jsonify({'error': validation['message']}), 400
+        return json_response({'error': validation['message']}, 400)
 
     service = get_visitor_service()
     visit_id, visit_data = service.record_visit(
@@ -37,7 +45,7 @@ def track_visit():
         timestamp=data.get('timestamp', '')
     )
 
-    service.log_http_request({
+    service.log_http_request_async({
         'method': request.method,
         'path': request.path,
         'ip': request.remote_addr,
@@ -45,26 +53,26 @@ def track_visit():
         'status_code': 201
     })
 
-    return jsonify({
+    return json_response({
         'status': 'success',
         'visit_id': visit_id,
         'message': '访问记录成功'
-    }), 201
+    }, 201)
 
 
 @tracker_bp.route('/event', methods=['POST'])
 def track_event():
     if not rate_limit_check(request.remote_addr):
-        return jsonify({'error': 'Rate limit exceeded'}), 429
+        return json_response({'error': 'Rate limit exceeded'}, 429)
 
-    data = request.get_json()
+    data = extract_fields(request.stream, ('eventType', 'eventData', 'visitId', 'elementSelector', 'timestamp'))
 
     if not data:
-        return jsonify({'error': 'No data provided'}), 400
+        return json_response({'error': 'No data provided'}, 400)
 
     event_type = data.get('eventType')
     if not event_type:
-        return jsonify({'error': 'Missing eventType'}), 400
+        return json_response({'error': 'Missing eventType'}, 400)
 
     service = get_visitor_service()
     event_id = service.record_event(
@@ -75,7 +83,7 @@ def track_event():
         timestamp=data.get('timestamp', '')
     )
 
-    service.log_http_request({
+    service.log_http_request_async({
         'method': request.method,
         'path': request.path,
         'ip': request.remote_addr,
@@ -83,42 +91,34 @@ def track_event():
         'status_code': 201
     })
 
-    return jsonify({
+    return json_response({
         'status': 'success',
         'event_id': event_id,
         'message': '事件记录成功'
-    }), 201
+    }, 201)
 
 
 @tracker_bp.route('/events', methods=['POST'])
 def track_events_batch():
     if not rate_limit_check(request.remote_addr):
-        return jsonify({'error': 'Rate limit exceeded'}), 429
+        return json_response({'error': 'Rate limit exceeded'}, 429)
 
-    data = request.get_json()
+    # cache=True keeps the parsed body on the request object and silent
+    # avoids a second decode attempt on malformed JSON.
+    data = request.get_json(cache=True, silent=True)
     events = data.get('events', []) if data else []
 
     if not events:
-        return jsonify({'error': 'No events provided'}), 400
+        return json_response({'error': 'No events provided'}, 400)
 
     service = get_visitor_service()
-    recorded_count = 0
-
-    for event_data in events:
-        service.record_event(
-            event_type=event_data.get('eventType', 'unknown'),
-            event_data=event_data.get('eventData', {}),
-            visit_id=event_data.get('visitId', ''),
-            element_selector=event_data.get('elementSelector', ''),
-            timestamp=event_data.get('timestamp', '')
-        )
-        recorded_count += 1
+    recorded_count = service.record_events_bulk(events)
 
-    return jsonify({
+    return json_response({
         'status': 'success',
         'recorded': recorded_count,
         'message': f'成功记录 {recorded_count} 个事件'
-    }), 201
+    }, 201)
 
 
 @tracker_bp.route('/stats', methods=['GET'])
@@ -135,7 +135,7 @@ def get_statistics():
         metric=metric
     )
 
-    service.log_http_request({
+    service.log_http_request_async({
         'method': request.method,
         'path': request.path,
         'ip': request.remote_addr,
@@ -143,11 +143,11 @@ def get_statistics():
         'status_code': 200
     })
 
-    return jsonify({
+    return json_response({
         'status': 'success',
         'metric': metric,
         'data': stats
-    }), 200
+    }, 200)
 
 
 @tracker_bp.route('/stats/overview', methods=['GET'])
@@ -156,10 +156,10 @@ def get_overview():
 
     stats = service.get_visitor_stats(metric='overview')
 
-    return jsonify({
+    return json_response({
         'status': 'success',
         'data': stats
-    }), 200
+    }, 200)
 
 
 @tracker_bp.route('/stats/pageviews', methods=['GET'])
@@ -168,10 +168,10 @@ def get_pageviews():
 
     stats = service.get_visitor_stats(metric='pageviews')
 
-    return jsonify({
+    return json_response({
         'status': 'success',
         'data': stats
-    }), 200
+    }, 200)
 
 
 @tracker_bp.route('/stats/visitors', methods=['GET'])
@@ -180,10 +180,10 @@ def get_visitors():
 
     stats = service.get_visitor_stats(metric='visitors')
 
-    return jsonify({
+    return json_response({
         'status': 'success',
         'data': stats
-    }), 200
+    }, 200)
 
 
 @tracker_bp.route('/logs', methods=['GET'])
@@ -198,11 +198,11 @@ def get_logs():
 
     logs = service.get_http_logs(limit=limit)
 
-    return jsonify({
+    return json_response({
         'status': 'success',
         'count': len(logs),
         'logs': logs
-    }), 200
+    }, 200)
 
 
 @tracker_bp.route('/logs/recent', methods=['GET'])
@@ -217,20 +217,16 @@ def get_recent_visits():
 
     visits = service.get_recent_visits(limit=limit)
 
-    return jsonify({
+    return json_response({
         'status': 'success',
         'count': len(visits),
         'visits': visits
-    }), 200
+    }, 200)
 
 
 @tracker_bp.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({
-        'status': 'healthy',
-        'service': 'visitor-tracker',
-        'version': '1.0.0'
-    }), 200
+    return current_app.response_class(_HEALTH_BODY, mimetype='application/json')
 
 
 @tracker_bp.route('/cleanup', methods=['POST'])
@@ -238,10 +234,10 @@ def cleanup_data():
     service = get_visitor_service()
     service.cleanup_data()
 
-    return jsonify({
+    return json_response({
         'status': 'success',
         'message': '数据清理完成'
-    }), 200
+    }, 200)
 
 
 @tracker_bp.route('/export', methods=['GET'])
@@ -255,13 +251,13 @@ def export_data():
 
     if format_type == 'json':
         response = Response(
-            json.dumps(stats, ensure_ascii=False, indent=2),
+            orjson.dumps(stats, option=orjson.OPT_INDENT_2),
             mimetype='application/json',
             headers={'Content-Disposition': f'attachment; filename=stats_{metric}.json'}
         )
         return response
 
-    return jsonify({
+    return json_response({
         'status': 'success',
         'data': stats
-    }), 200
+    }, 200)
@@ -1,25 +1,191 @@
+import heapq
 import os
-import json
-from datetime import datetime
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
 from collections import defaultdict
+from urllib.parse import urlparse
+
+import orjson
+
 from tracker.utils import (
     generate_visitor_id,
     anonymize_ip,
     get_device_info,
     read_json_file,
-    write_json_file,
-    get_date_range
+    append_jsonl_many,
+    close_append_handle,
+    iter_jsonl
 )
 
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS visits (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    visit_id TEXT NOT NULL,
+    ip_address TEXT NOT NULL DEFAULT '',
+    user_agent TEXT NOT NULL DEFAULT '',
+    page_url TEXT NOT NULL DEFAULT '',
+    referrer TEXT NOT NULL DEFAULT '',
+    screen_resolution TEXT NOT NULL DEFAULT '',
+    language TEXT NOT NULL DEFAULT '',
+    timestamp TEXT NOT NULL DEFAULT '',
+    device_json TEXT NOT NULL DEFAULT '{}',
+    session_id TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_visits_timestamp ON visits(timestamp);
+
+CREATE TABLE IF NOT EXISTS events (
+    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    visit_id TEXT NOT NULL DEFAULT '',
+    event_type TEXT NOT NULL,
+    event_data_json TEXT NOT NULL DEFAULT '{}',
+    element_selector TEXT NOT NULL DEFAULT '',
+    timestamp TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp);
+"""
+
+_INSERT_VISIT = """
+INSERT INTO visits (visit_id, ip_address, user_agent, page_url, referrer,
+                    screen_resolution, language, timestamp, device_json, session_id)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_INSERT_EVENT = """
+INSERT INTO events (visit_id, event_type, event_data_json, element_selector, timestamp)
+VALUES (?, ?, ?, ?, ?)
+"""
+
+
+# _data_version only sees writes handled by this process, so under a
+# multi-worker deployment a worker can hold stats that another worker's
+# write has invalidated; the TTL bounds that staleness. The entry cap
+# keeps unauthenticated requests with many distinct (valid) date ranges
+# from pinning unlimited aggregate bundles.
+_stats_cache = {}
+_STATS_CACHE_MAX_ENTRIES = 128
+_STATS_CACHE_TTL = 30
+_data_version = 0
+
+_log_line_counts = {}
+
+_log_queue = queue.Queue(maxsize=10000)
+_log_worker_lock = threading.Lock()
+_log_worker = None
+
+
+def _log_worker_loop(service):
+    while True:
+        batch = [_log_queue.get()]
+        try:
+            while True:
+                batch.append(_log_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        try:
+            service._write_log_entries(batch)
+        except Exception:
+            pass
+
+
+def _ensure_log_worker(service):
+    global _log_worker
+    if _log_worker is None:
+        with _log_worker_lock:
+            if _log_worker is None:
+                _log_worker = threading.Thread(
+                    target=_log_worker_loop,
+                    args=(service,),
+                    name='http-log-writer',
+                    daemon=True
+                )
+                _log_worker.start()
+
+
+def _bump_data_version():
+    global _data_version
+    _data_version += 1
+    _stats_cache.clear()
+
 
 class VisitorService:
     def __init__(self, config):
         self.config = config
         self.data_dir = 'data'
-        self.visits_file = os.path.join(self.data_dir, 'visits.json')
-        self.events_file = os.path.join(self.data_dir, 'events.json')
+        self.db_file = os.path.join(self.data_dir, 'tracker.db')
         os.makedirs(self.data_dir, exist_ok=True)
 
+        # One connection shared across request handlers and guarded by a
+        # lock for writes; WAL lets readers proceed during a write and
+        # NORMAL sync gives durable-enough group commits for tracking data.
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_file, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(_SCHEMA)
+
+        self._migrate_legacy_stores()
+
+    def _migrate_legacy_stores(self):
+        # Multiple gunicorn workers run this at boot; the one that
+        # creates the lockfile performs the one-time import, the rest
+        # skip it. The lockfile is left behind as a done marker.
+        lock_path = os.path.join(self.data_dir, 'migrated.lock')
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return
+
+        for legacy_name, loader, inserter in (
+            ('visits.jsonl', iter_jsonl, self._insert_legacy_visits),
+            ('visits.json', read_json_file, self._insert_legacy_visits),
+            ('events.jsonl', iter_jsonl, self._insert_legacy_events),
+            ('events.json', read_json_file, self._insert_legacy_events)
+        ):
+            legacy_path = os.path.join(self.data_dir, legacy_name)
+            if os.path.exists(legacy_path):
+                inserter(loader(legacy_path))
+                try:
+                    os.rename(legacy_path, legacy_path + '.bak')
+                except FileNotFoundError:
+                    pass
+
+    def _insert_legacy_visits(self, records):
+        rows = [
+            (
+                v.get('visit_id', ''),
+                v.get('ip_address', ''),
+                v.get('user_agent', ''),
+                v.get('page_url', ''),
+                v.get('referrer', ''),
+                v.get('screen_resolution', ''),
+                v.get('language', ''),
+                v.get('timestamp', ''),
+                orjson.dumps(v.get('device', {})).decode('utf-8'),
+                v.get('session_id', '')
+            )
+            for v in records
+        ]
+        with self._db_lock, self._db:
+            self._db.executemany(_INSERT_VISIT, rows)
+
+    def _insert_legacy_events(self, records):
+        rows = [
+            (
+                e.get('visit_id', ''),
+                e.get('event_type', 'unknown'),
+                orjson.dumps(e.get('event_data', {})).decode('utf-8'),
+                e.get('element_selector', ''),
+                e.get('timestamp', '')
+            )
+            for e in records
+        ]
+        with self._db_lock, self._db:
+            self._db.executemany(_INSERT_EVENT, rows)
+
     def record_visit(self, ip_address, user_agent, page_url, referrer,
                      screen_resolution, language, timestamp):
         anonymized_ip = anonymize_ip(ip_address) if self.config.get('anonymize_ip', True) else ip_address
@@ -40,105 +206,240 @@ class VisitorService:
             'session_id': visit_id
         }
 
-        visits = read_json_file(self.visits_file)
-        visits.append(visit_data)
-        write_json_file(self.visits_file, visits)
+        with self._db_lock, self._db:
+            self._db.execute(_INSERT_VISIT, (
+                visit_data['visit_id'],
+                visit_data['ip_address'],
+                visit_data['user_agent'],
+                visit_data['page_url'],
+                visit_data['referrer'],
+                visit_data['screen_resolution'],
+                visit_data['language'],
+                visit_data['timestamp'],
+                orjson.dumps(device_info).decode('utf-8'),
+                visit_data['session_id']
+            ))
+        _bump_data_version()
 
         return visit_id, visit_data
 
     def record_event(self, event_type, event_data, visit_id, element_selector, timestamp):
-        event = {
-            'event_id': len(read_json_file(self.events_file)) + 1,
-            'visit_id': visit_id,
-            'event_type': event_type,
-            'event_data': event_data or {},
-            'element_selector': element_selector or '',
-            'timestamp': timestamp or datetime.utcnow().isoformat()
-        }
+        with self._db_lock, self._db:
+            cursor = self._db.execute(_INSERT_EVENT, (
+                visit_id,
+                event_type,
+                orjson.dumps(event_data or {}).decode('utf-8'),
+                element_selector or '',
+                timestamp or datetime.utcnow().isoformat()
+            ))
+            event_id = cursor.lastrowid
+        _bump_data_version()
+
+        return event_id
+
+    def record_events_bulk(self, events_list):
+        if not events_list:
+            return 0
+
+        now = datetime.utcnow().isoformat()
+
+        rows = [
+            (
+                e.get('visitId', ''),
+                e.get('eventType', 'unknown'),
+                orjson.dumps(e.get('eventData', {}) or {}).decode('utf-8'),
+                e.get('elementSelector', ''),
+                e.get('timestamp', '') or now
+            )
+            for e in events_list
+        ]
 
-        events = read_json_file(self.events_file)
-        events.append(event)
-        write_json_file(self.events_file, events)
+        with self._db_lock, self._db:
+            self._db.executemany(_INSERT_EVENT, rows)
+        _bump_data_version()
 
-        return event['event_id']
+        return len(rows)
 
     def get_visitor_stats(self, start_date=None, end_date=None, metric='overview'):
-        visits = read_json_file(self.visits_file)
-        events = read_json_file(self.events_file)
+        aggregates = self._get_aggregates(start_date, end_date)
+
+        builders = {
+            'overview': self._build_overview,
+            'pageviews': self._build_pageviews,
+            'visitors': self._build_visitors,
+            'sources': self._build_sources,
+            'devices': self._build_devices,
+            'browsers': self._build_browsers,
+            'timeline': self._build_timeline,
+            'events': self._build_events_summary
+        }
 
+        return builders.get(metric, self._build_overview)(aggregates)
+
+    def _get_aggregates(self, start_date, end_date):
+        # Key the cache on the validated bounds actually used for
+        # filtering, so garbage date strings all collapse onto the
+        # unfiltered entry instead of each pinning their own bundle.
+        start_bound, end_bound = self._normalize_date_bounds(start_date, end_date)
+        cache_key = (start_bound, end_bound, _data_version)
+        now = time.monotonic()
+
+        cached = _stats_cache.get(cache_key)
+        if cached is not None and now - cached[0] < _STATS_CACHE_TTL:
+            return cached[1]
+
+        visits = self._iter_filtered_visits(start_bound, end_bound)
+        aggregates = self._compute_aggregates(visits, self._iter_events())
+
+        if len(_stats_cache) >= _STATS_CACHE_MAX_ENTRIES:
+            _stats_cache.clear()
+        _stats_cache[cache_key] = (now, aggregates)
+        return aggregates
+
+    def _normalize_date_bounds(self, start_date, end_date):
+        # Timestamps are ISO-8601, so once the boundary strings are known
+        # to be valid, plain string comparison (done by SQLite over the
+        # timestamp index) orders them correctly. Invalid bounds are
+        # dropped, matching the old silently-ignore behavior.
+        start_bound = None
         if start_date:
             try:
-                start_dt = datetime.fromisoformat(start_date)
-                visits = [v for v in visits if datetime.fromisoformat(v['timestamp']) >= start_dt]
-            except ValueError:
+                datetime.fromisoformat(start_date)
+                start_bound = start_date
+            except (TypeError, ValueError):
                 pass
 
+        end_bound = None
         if end_date:
             try:
-                end_dt = datetime.fromisoformat(end_date)
-                visits = [v for v in visits if datetime.fromisoformat(v['timestamp']) <= end_dt]
-            except ValueError:
+                datetime.fromisoformat(end_date)
+                end_bound = end_date if 'T' in end_date else end_date + 'T23:59:59'
+            except (TypeError, ValueError):
                 pass
 
-        stats = {
-            'overview': self._calculate_overview(visits, events),
-            'pageviews': self._calculate_pageviews(visits),
-            'visitors': self._calculate_visitors(visits),
-            'sources': self._calculate_sources(visits),
-            'devices': self._calculate_devices(visits),
-            'browsers': self._calculate_browsers(visits),
-            'timeline': self._calculate_timeline(visits),
-            'events': self._calculate_events_summary(events)
-        }
+        return start_bound, end_bound
+
+    def _iter_filtered_visits(self, start_bound, end_bound):
+        query = 'SELECT visit_id, page_url, referrer, timestamp, device_json FROM visits'
+        clauses = []
+        params = []
+
+        if start_bound:
+            clauses.append('timestamp >= ?')
+            params.append(start_bound)
+
+        if end_bound:
+            clauses.append('timestamp <= ?')
+            params.append(end_bound)
+
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
 
-        return stats.get(metric, stats['overview'])
+        for visit_id, page_url, referrer, timestamp, device_json in self._db.execute(query, params):
+            yield {
+                'visit_id': visit_id,
+                'page_url': page_url,
+                'referrer': referrer,
+                'timestamp': timestamp,
+                'device': orjson.loads(device_json) if device_json else {}
+            }
 
-    def _calculate_overview(self, visits, events):
-        unique_visitors = len(set(v['visit_id'] for v in visits))
+    def _iter_events(self):
+        for (event_type,) in self._db.execute('SELECT event_type FROM events'):
+            yield {'event_type': event_type}
+
+    def _compute_aggregates(self, visits, events):
+        total_visits = 0
+        pageviews = defaultdict(int)
+        sources = defaultdict(int)
+        devices = defaultdict(int)
+        os_count = defaultdict(int)
+        browsers = defaultdict(int)
+        visitors = defaultdict(lambda: {'visits': 0, 'first_seen': None, 'last_seen': None})
+        daily = defaultdict(lambda: {'pageviews': 0, 'visitors': set()})
 
-        daily_visits = defaultdict(int)
         for v in visits:
-            date = v['timestamp'][:10]
-            daily_visits[date] += 1
+            total_visits += 1
+            timestamp = v['timestamp']
+            date = timestamp[:10]
+            vid = v['visit_id']
+
+            pageviews[v['page_url']] += 1
+
+            referrer = v.get('referrer', '')
+            source = ''
+            if referrer:
+                try:
+                    source = urlparse(referrer).netloc
+                except ValueError:
+                    source = ''
+            sources[source or 'Direct'] += 1
+
+            device = v.get('device', {})
+            devices[device.get('device', 'Unknown')] += 1
+            os_count[device.get('os', 'Unknown')] += 1
+            browsers[device.get('browser', 'Unknown')] += 1
+
+            visitor = visitors[vid]
+            visitor['visits'] += 1
+            if not visitor['first_seen'] or timestamp < visitor['first_seen']:
+                visitor['first_seen'] = timestamp
+            if not visitor['last_seen'] or timestamp > visitor['last_seen']:
+                visitor['last_seen'] = timestamp
+
+            day = daily[date]
+            day['pageviews'] += 1
+            day['visitors'].add(vid)
+
+        total_events = 0
+        event_types = defaultdict(int)
+        for e in events:
+            total_events += 1
+            event_types[e['event_type']] += 1
+
+        return {
+            'total_visits': total_visits,
+            'pageviews': pageviews,
+            'sources': sources,
+            'devices': devices,
+            'os_count': os_count,
+            'browsers': browsers,
+            'visitors': visitors,
+            'daily': daily,
+            'total_events': total_events,
+            'event_types': event_types
+        }
+
+    def _build_overview(self, aggregates):
+        daily = aggregates['daily']
 
         avg_daily = 0
-        if daily_visits:
-            avg_daily = sum(daily_visits.values()) / len(daily_visits)
+        if daily:
+            avg_daily = aggregates['total_visits'] / len(daily)
 
         return {
-            'total_pageviews': len(visits),
-            'unique_visitors': unique_visitors,
-            'total_events': len(events),
+            'total_pageviews': aggregates['total_visits'],
+            'unique_visitors': len(aggregates['visitors']),
+            'total_events': aggregates['total_events'],
             'avg_daily_visits': round(avg_daily, 2),
             'date_range': {
-                'start': min(v['timestamp'][:10] for v in visits) if visits else None,
-                'end': max(v['timestamp'][:10] for v in visits) if visits else None
+                'start': min(daily) if daily else None,
+                'end': max(daily) if daily else None
             },
-            'top_pages': self._get_top_pages(visits, 10)
+            'top_pages': self._top_pages(aggregates['pageviews'], 10)
         }
 
-    def _calculate_pageviews(self, visits):
-        pageviews = defaultdict(int)
-        for v in visits:
-            pageviews[v['page_url']] += 1
-
-        sorted_pages = sorted(pageviews.items(), key=lambda x: x[1], reverse=True)
+    def _build_pageviews(self, aggregates):
+        top_pages = heapq.nlargest(50, aggregates['pageviews'].items(), key=lambda x: x[1])
 
         return {
-            'total': len(visits),
-            'by_page': dict(sorted_pages[:50]),
-            'top_pages': [{'url': url, 'views': count} for url, count in sorted_pages[:10]]
+            'total': aggregates['total_visits'],
+            'by_page': dict(top_pages),
+            'top_pages': [{'url': url, 'views': count} for url, count in top_pages[:10]]
         }
 
-    def _calculate_visitors(self, visits):
-        visitors = defaultdict(lambda: {'visits': 0, 'first_seen': None, 'last_seen': None})
-        for v in visits:
-            vid = v['visit_id']
-            visitors[vid]['visits'] += 1
-            if not visitors[vid]['first_seen'] or v['timestamp'] < visitors[vid]['first_seen']:
-                visitors[vid]['first_seen'] = v['timestamp']
-            if not visitors[vid]['last_seen'] or v['timestamp'] > visitors[vid]['last_seen']:
-                visitors[vid]['last_seen'] = v['timestamp']
+    def _build_visitors(self, aggregates):
+        visitors = aggregates['visitors']
 
         return {
             'unique_visitors': len(visitors),
@@ -149,58 +450,24 @@ class VisitorService:
             ]
         }
 
-    def _calculate_sources(self, visits):
-        sources = defaultdict(int)
-        for v in visits:
-            referrer = v.get('referrer', '') or 'Direct'
-            if referrer:
-                try:
-                    from urllib.parse import urlparse
-                    source = urlparse(referrer).netloc
-                    if source:
-                        sources[source] += 1
-                        continue
-                except:
-                    pass
-            sources['Direct'] += 1
-
-        sorted_sources = sorted(sources.items(), key=lambda x: x[1], reverse=True)
+    def _build_sources(self, aggregates):
+        top_sources = heapq.nlargest(20, aggregates['sources'].items(), key=lambda x: x[1])
         return {
-            'by_source': dict(sorted_sources[:20]),
-            'top_sources': [{'source': src, 'visits': count} for src, count in sorted_sources[:10]]
+            'by_source': dict(top_sources),
+            'top_sources': [{'source': src, 'visits': count} for src, count in top_sources[:10]]
         }
 
-    def _calculate_devices(self, visits):
-        devices = defaultdict(int)
-        os_count = defaultdict(int)
-
-        for v in visits:
-            device = v.get('device', {})
-            devices[device.get('device', 'Unknown')] += 1
-            os_count[device.get('os', 'Unknown')] += 1
-
+    def _build_devices(self, aggregates):
         return {
-            'devices': dict(sorted(devices.items(), key=lambda x: x[1], reverse=True)),
-            'operating_systems': dict(sorted(os_count.items(), key=lambda x: x[1], reverse=True))
+            'devices': dict(sorted(aggregates['devices'].items(), key=lambda x: x[1], reverse=True)),
+            'operating_systems': dict(sorted(aggregates['os_count'].items(), key=lambda x: x[1], reverse=True))
         }
 
-    def _calculate_browsers(self, visits):
-        browsers = defaultdict(int)
-
-        for v in visits:
-            device = v.get('device', {})
-            browser = device.get('browser', 'Unknown')
-            browsers[browser] += 1
-
-        return dict(sorted(browsers.items(), key=lambda x: x[1], reverse=True))
+    def _build_browsers(self, aggregates):
+        return dict(sorted(aggregates['browsers'].items(), key=lambda x: x[1], reverse=True))
 
-    def _calculate_timeline(self, visits):
-        daily = defaultdict(lambda: {'pageviews': 0, 'visitors': set()})
-
-        for v in visits:
-            date = v['timestamp'][:10]
-            daily[date]['pageviews'] += 1
-            daily[date]['visitors'].add(v['visit_id'])
+    def _build_timeline(self, aggregates):
+        daily = aggregates['daily']
 
         timeline = []
         for date in sorted(daily.keys()):
@@ -213,23 +480,15 @@ class VisitorService:
 
         return timeline
 
-    def _calculate_events_summary(self, events):
-        event_types = defaultdict(int)
-        for e in events:
-            event_types[e['event_type']] += 1
-
+    def _build_events_summary(self, aggregates):
         return {
-            'total_events': len(events),
-            'by_type': dict(event_types)
+            'total_events': aggregates['total_events'],
+            'by_type': dict(aggregates['event_types'])
         }
 
-    def _get_top_pages(self, visits, limit=10):
-        pageviews = defaultdict(int)
-        for v in visits:
-            pageviews[v['page_url']] += 1
-
-        sorted_pages = sorted(pageviews.items(), key=lambda x: x[1], reverse=True)
-        return [{'url': url, 'views': count} for url, count in sorted_pages[:limit]]
+    def _top_pages(self, pageviews, limit=10):
+        top = heapq.nlargest(limit, pageviews.items(), key=lambda x: x[1])
+        return [{'url': url, 'views': count} for url, count in top]
 
     def get_http_logs(self, limit=100):
         log_file = self.config.get('log_file', 'data/http_access.log')
@@ -244,67 +503,94 @@ class VisitorService:
             return []
 
     def log_http_request(self, request_info):
+        self._write_log_entries([request_info])
+
+    def log_http_request_async(self, request_info):
+        _ensure_log_worker(self)
+        try:
+            _log_queue.put_nowait(request_info)
+        except queue.Full:
+            pass
+
+    def _write_log_entries(self, request_infos):
         log_file = self.config.get('log_file', 'data/http_access.log')
         os.makedirs(os.path.dirname(log_file), exist_ok=True)
 
-        log_entry = {
-            'timestamp': datetime.utcnow().isoformat(),
-            'method': request_info.get('method', ''),
-            'path': request_info.get('path', ''),
-            'ip': request_info.get('ip', ''),
-            'user_agent': request_info.get('user_agent', ''),
-            'status_code': request_info.get('status_code', 200)
-        }
+        log_entries = [
+            {
+                'timestamp': datetime.utcnow().isoformat(),
+                'method': info.get('method', ''),
+                'path': info.get('path', ''),
+                'ip': info.get('ip', ''),
+                'user_agent': info.get('user_agent', ''),
+                'status_code': info.get('status_code', 200)
+            }
+            for info in request_infos
+        ]
 
         max_lines = self.config.get('max_log_lines', 10000)
 
         try:
-            lines = []
-            if os.path.exists(log_file):
-                with open(log_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
+            append_jsonl_many(log_file, log_entries)
+        except IOError:
+            return
 
-            lines.append(json.dumps(log_entry, ensure_ascii=False) + '\n')
+        count = _log_line_counts.get(log_file)
+        if count is None:
+            count = self._count_log_lines(log_file)
+        else:
+            count += len(log_entries)
+        _log_line_counts[log_file] = count
 
-            if len(lines) > max_lines:
-                lines = lines[-max_lines:]
+        if count > max_lines * 1.1:
+            self._rotate_log(log_file)
 
-            with open(log_file, 'w', encoding='utf-8') as f:
-                f.writelines(lines)
+    def _count_log_lines(self, log_file):
+        try:
+            with open(log_file, 'r', encoding='utf-8') as f:
+                return sum(1 for _ in f)
         except IOError:
-            pass
+            return 0
+
+    def _rotate_log(self, log_file):
+        close_append_handle(log_file)
+        try:
+            os.replace(log_file, log_file + '.1')
+        except OSError:
+            return
+        _log_line_counts[log_file] = 0
 
     def get_recent_visits(self, limit=20):
-        visits = read_json_file(self.visits_file)
-        sorted_visits = sorted(visits, key=lambda x: x.get('timestamp', ''), reverse=True)
-        return sorted_visits[:limit]
+        query = """
+            SELECT visit_id, ip_address, user_agent, page_url, referrer,
+                   screen_resolution, language, timestamp, device_json, session_id
+            FROM visits ORDER BY timestamp DESC LIMIT ?
+        """
+        return [
+            {
+                'visit_id': row[0],
+                'ip_address': row[1],
+                'user_agent': row[2],
+                'page_url': row[3],
+                'referrer': row[4],
+                'screen_resolution': row[5],
+                'language': row[6],
+                'timestamp': row[7],
+                'device': orjson.loads(row[8]) if row[8] else {},
+                'session_id': row[9]
+            }
+            for row in self._db.execute(query, (limit,))
+        ]
 
     def cleanup_data(self, days=None):
         if days is None:
             days = self.config.get('data_retention_days', 90)
 
-        cleanup_files = [
-            (self.visits_file, days),
-            (self.events_file, days)
-        ]
-
-        for filepath, retention_days in cleanup_files:
-            if os.path.exists(filepath):
-                cutoff_date = datetime.utcnow() - datetime.timedelta(days=retention_days)
-
-                data = read_json_file(filepath)
-                cleaned_data = []
-
-                for item in data:
-                    timestamp = item.get('timestamp', '')
-                    if timestamp:
-                        try:
-                            item_date = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                            if item_date >= cutoff_date:
-                                cleaned_data.append(item)
-                        except ValueError:
-                            cleaned_data.append(item)
+        cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
 
-                write_json_file(filepath, cleaned_data)
+        with self._db_lock, self._db:
+            self._db.execute("DELETE FROM visits WHERE timestamp != '' AND timestamp < ?", (cutoff,))
+            self._db.execute("DELETE FROM events WHERE timestamp != '' AND timestamp < ?", (cutoff,))
 
+        _bump_data_version()
         return True
@@ -1,32 +1,76 @@
-import json
 import hashlib
+import ipaddress
 import time
 import os
+import threading
 from datetime import datetime, timedelta
-from collections import deque
+from collections import OrderedDict
+from functools import lru_cache
+
+import ijson
+import orjson
+from ua_parser import user_agent_parser
 
 
 class RateLimiter:
-    def __init__(self, max_requests=100, time_window=60):
+    def __init__(self, max_requests=100, time_window=60, max_entries=100000):
         self.max_requests = max_requests
         self.time_window = time_window
-        self.requests = {}
+        self.refill_rate = max_requests / time_window
+        self.max_entries = max_entries
+        self.buckets = OrderedDict()
+        self.blocked_until = {}
 
     def is_allowed(self, identifier):
-        now = time.time()
-        if identifier not in self.requests:
-            self.requests[identifier] = deque()
+        # Token bucket: each identifier holds [tokens, last_refill] and
+        # refills continuously, so a check is O(1) instead of draining a
+        # deque of per-request timestamps.
+        now = time.monotonic()
+
+        # Fast path for identifiers already over the limit: a hammering
+        # client costs one dict lookup and a compare until a token has
+        # actually accrued.
+        blocked_until = self.blocked_until.get(identifier)
+        if blocked_until is not None:
+            if now < blocked_until:
+                return False
+            del self.blocked_until[identifier]
+
+        self._evict_stale(now)
+        bucket = self.buckets.get(identifier)
+
+        if bucket is None:
+            if len(self.buckets) >= self.max_entries:
+                self.buckets.popitem(last=False)
+            self.buckets[identifier] = [self.max_requests - 1, now]
+            return True
 
-        while self.requests[identifier] and \
-                self.requests[identifier][0] <= now - self.time_window:
-            self.requests[identifier].popleft()
+        self.buckets.move_to_end(identifier)
 
-        if len(self.requests[identifier]) < self.max_requests:
-            self.requests[identifier].append(now)
+        tokens, last_refill = bucket
+        tokens = min(self.max_requests, tokens + (now - last_refill) * self.refill_rate)
+        bucket[1] = now
+
+        if tokens >= 1:
+            bucket[0] = tokens - 1
             return True
 
+        bucket[0] = tokens
+        if len(self.blocked_until) >= self.max_entries:
+            self.blocked_until = {k: v for k, v in self.blocked_until.items() if v > now}
+        self.blocked_until[identifier] = now + (1 - tokens) / self.refill_rate
         return False
 
+    def _evict_stale(self, now):
+        # Buckets are kept in least-recently-used order, so expired
+        # entries cluster at the front and eviction stays amortized O(1).
+        cutoff = now - self.time_window * 2
+        while self.buckets:
+            bucket = next(iter(self.buckets.values()))
+            if bucket[1] >= cutoff:
+                break
+            self.buckets.popitem(last=False)
+
 
 rate_limiter = RateLimiter(max_requests=100, time_window=60)
 
@@ -36,44 +80,97 @@ def rate_limit_check(ip_address):
 
 
 def generate_visitor_id(ip_address, user_agent):
+    # blake2b is noticeably faster than md5 for short inputs, and an
+    # 8-byte digest gives the same 16 hex chars the old truncation did.
     combined = f"{ip_address}-{user_agent}"
-    return hashlib.md5(combined.encode()).hexdigest()[:16]
+    return hashlib.blake2b(combined.encode(), digest_size=8).hexdigest()
 
 
+@lru_cache(maxsize=65536)
 def anonymize_ip(ip_address):
     if not ip_address:
         return ''
-    parts = ip_address.split('.')
-    if len(parts) == 4:
-        return f"{parts[0]}.{parts[1]}.xxx.xxx"
-    return ip_address
 
+    if ':' in ip_address:
+        try:
+            ip = ipaddress.ip_address(ip_address)
+            return str(ipaddress.ip_network((ip, 96), strict=False).network_address)
+        except ValueError:
+            return ip_address
+
+    # IPv4: keep the first two octets without allocating a split list.
+    second_dot = ip_address.rfind('.', 0, ip_address.rfind('.'))
+    if second_dot != -1:
+        return ip_address[:second_dot] + '.xxx.xxx'
+    return ip_address
 
-def get_device_info(user_agent):
-    from ua_parser import user_agent_parser
 
+@lru_cache(maxsize=4096)
+def _parse_user_agent(user_agent):
     parsed = user_agent_parser.Parse(user_agent)
+    return (
+        parsed.get('user_agent', {}).get('family', 'Unknown'),
+        parsed.get('user_agent', {}).get('major', ''),
+        parsed.get('os', {}).get('family', 'Unknown'),
+        parsed.get('os', {}).get('major', ''),
+        parsed.get('device', {}).get('family', 'Desktop')
+    )
+
+
+def get_device_info(user_agent):
+    # Most traffic comes from a small set of user-agent strings, so the
+    # parse result is memoized; callers get a fresh dict each time.
+    browser, browser_version, os_family, os_version, device = _parse_user_agent(user_agent)
     return {
-        'browser': parsed.get('user_agent', {}).get('family', 'Unknown'),
-        'browser_version': parsed.get('user_agent', {}).get('major', ''),
-        'os': parsed.get('os', {}).get('family', 'Unknown'),
-        'os_version': parsed.get('os', {}).get('major', ''),
-        'device': parsed.get('device', {}).get('family', 'Desktop')
+        'browser': browser,
+        'browser_version': browser_version,
+        'os': os_family,
+        'os_version': os_version,
+        'device': device
     }
 
 
+class _ProbeSafeStream:
+    # ijson probes its source with read(0) to pick a backend, but
+    # Werkzeug's request stream treats a zero-byte read as a client
+    # disconnect and raises; answer the probe with b'' ourselves.
+    def __init__(self, stream):
+        self._stream = stream
+
+    def read(self, size=-1):
+        if size == 0:
+            return b''
+        return self._stream.read(size)
+
+
+def extract_fields(stream, field_names):
+    # Pull only the named top-level fields out of a JSON body without
+    # materializing the whole document, stopping as soon as all wanted
+    # fields have been seen.
+    wanted = set(field_names)
+    result = {}
+    try:
+        for key, value in ijson.kvitems(_ProbeSafeStream(stream), '', use_float=True):
+            if key in wanted:
+                result[key] = value
+                if len(result) == len(wanted):
+                    break
+    except ijson.JSONError:
+        return None
+    return result or None
+
+
 def validate_visitor_data(data):
     if not data:
         return {'valid': False, 'message': 'No data provided'}
 
     page_url = data.get('pageUrl')
+    if type(page_url) is str and 0 < len(page_url) <= 2048:
+        return {'valid': True, 'message': 'Validation passed'}
+
     if not page_url:
         return {'valid': False, 'message': 'Missing required field: pageUrl'}
-
-    if not isinstance(page_url, str) or len(page_url) > 2048:
-        return {'valid': False, 'message': 'Invalid page URL format'}
-
-    return {'valid': True, 'message': 'Validation passed'}
+    return {'valid': False, 'message': 'Invalid page URL format'}
 
 
 def get_date_range(days=30):
@@ -86,34 +183,55 @@ def read_json_file(filepath):
     if not os.path.exists(filepath):
         return []
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError):
+        with open(filepath, 'rb') as f:
+            return orjson.loads(f.read())
+    except (orjson.JSONDecodeError, IOError):
         return []
 
 
-def write_json_file(filepath, data):
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+_append_handles = {}
+_append_lock = threading.Lock()
 
 
-def cleanup_old_data(filepath, days=90):
-    if not os.path.exists(filepath):
-        return
+def _get_append_handle(filepath):
+    f = _append_handles.get(filepath)
+    if f is None or f.closed:
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        f = open(filepath, 'ab')
+        _append_handles[filepath] = f
+    return f
 
-    cutoff_date = datetime.utcnow() - timedelta(days=days)
-    data = read_json_file(filepath)
 
-    cleaned_data = []
-    for item in data:
-        timestamp = item.get('timestamp', '')
-        if timestamp:
+def close_append_handle(filepath):
+    with _append_lock:
+        f = _append_handles.pop(filepath, None)
+        if f is not None:
             try:
-                item_date = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                if item_date >= cutoff_date:
-                    cleaned_data.append(item)
-            except ValueError:
-                cleaned_data.append(item)
+                f.close()
+            except IOError:
+                pass
 
-    write_json_file(filepath, cleaned_data)
+
+def append_jsonl_many(filepath, objs):
+    data = b''.join(orjson.dumps(obj) + b'\n' for obj in objs)
+    with _append_lock:
+        f = _get_append_handle(filepath)
+        f.write(data)
+        f.flush()
+
+
+def iter_jsonl(filepath):
+    if not os.path.exists(filepath):
+        return
+    try:
+        with open(filepath, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    continue
+    except IOError:
+        return